@@ -1,11 +1,7 @@
 from dotenv import load_dotenv
 import os
-import boto3
 from typing import Dict, List, Optional
 
-# Load environment variables from .env file (safe if not present)
-load_dotenv()
-
 def get_aws_costs(
     start_date: str,
     end_date: str,
@@ -23,6 +19,10 @@ def get_aws_costs(
     - group_by: e.g., [{'Type': 'DIMENSION', 'Key': 'SERVICE'}]
     - aws_access_key_id/secret: override env if provided
     """
+    # boto3 is heavy to import; load it (and .env, safe if not present) only when a fetch runs
+    import boto3
+
+    load_dotenv()
     if metrics is None:
         metrics = ['UnblendedCost']
 
@@ -1,10 +1,6 @@
 from dotenv import load_dotenv
 import os
 from typing import Dict, List, Optional
-from azure.identity import ClientSecretCredential
-from azure.mgmt.costmanagement import CostManagementClient
-
-load_dotenv()
 
 def get_azure_costs(
     timeframe: str = "MonthToDate",
@@ -22,6 +18,11 @@ def get_azure_costs(
     - group_by_dimensions: e.g., ["ServiceName", "ResourceGroup", "SubscriptionId"]
     - scope_subscription_id: defaults to AZURE_SUBSCRIPTION_ID from env
     """
+    # Azure SDKs are heavy to import; load them (and .env) only when a fetch runs
+    from azure.identity import ClientSecretCredential
+    from azure.mgmt.costmanagement import CostManagementClient
+
+    load_dotenv()
     azure_client_id = azure_client_id or os.getenv("AZURE_CLIENT_ID")
     azure_client_secret = azure_client_secret or os.getenv("AZURE_CLIENT_SECRET")
     azure_tenant_id = azure_tenant_id or os.getenv("AZURE_TENANT_ID")
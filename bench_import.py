@@ -0,0 +1,91 @@
+"""Import-time benchmark for the dashboard module.
+
+Runs ``python -X importtime -c "import cloud_cost_dashboard"`` in fresh
+interpreters and prints the slowest imports of the best run. It fails when a
+module that should load lazily shows up.
+
+The total is reported, not enforced, by default. Most of it is dash (which
+pulls in IPython, prompt_toolkit and jedi where they are installed) and pandas,
+so it varies by machine and install. Pass --budget-ms (or IMPORT_BUDGET_MS) to
+also fail above a budget measured on your own setup.
+
+    python bench_import.py [--runs 5] [--budget-ms 1500] [--top 15]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+TARGET = "cloud_cost_dashboard"
+# Heavy modules that must only load on first use, never at import time
+LAZY_MODULES = ("boto3", "botocore", "azure", "pdfplumber", "plotly.express", "apscheduler", "sqlalchemy", "google.cloud")
+
+
+def _run_once() -> List[Tuple[str, int, int]]:
+    """Return (module, self_us, cumulative_us) rows reported by -X importtime."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {TARGET}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {TARGET} failed:\n{proc.stderr}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def _top_level_packages(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    totals: Dict[str, int] = {}
+    for name, self_us, _ in rows:
+        root = name.split(".")[0]
+        totals[root] = totals.get(root, 0) + self_us
+    return totals
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    budget = os.getenv("IMPORT_BUDGET_MS")
+    parser.add_argument("--budget-ms", type=float, default=float(budget) if budget else None)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    best = None
+    for _ in range(args.runs):
+        rows = _run_once()
+        total = next(cum for name, _, cum in rows if name == TARGET)
+        if best is None or total < best[0]:
+            best = (total, rows)
+    total_us, rows = best
+
+    budget_note = f"budget {args.budget_ms:.0f} ms" if args.budget_ms is not None else "no budget"
+    print(f"{TARGET}: {total_us / 1000:.1f} ms (best of {args.runs}, {budget_note})")
+    print("\nSlowest packages by self time:")
+    for root, us in sorted(_top_level_packages(rows).items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {root}")
+
+    loaded = {name for name, _, _ in rows}
+    eager = sorted(m for m in LAZY_MODULES if any(n == m or n.startswith(m + ".") for n in loaded))
+    failed = False
+    if eager:
+        print(f"\nFAIL: imported eagerly: {', '.join(eager)}")
+        failed = True
+    if args.budget_ms is not None and total_us / 1000 > args.budget_ms:
+        print(f"\nFAIL: import time over budget by {total_us / 1000 - args.budget_ms:.1f} ms")
+        failed = True
+    if not failed:
+        print("\nOK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
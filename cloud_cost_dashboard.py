@@ -1,56 +1,113 @@
 import dash
 from dash import dcc, html, Input, Output, State
 import pandas as pd
-import plotly.express as px
 import io
 from datetime import datetime
-from db import init_db, get_session, CostRecord, save_credentials
-from scheduler import start_scheduler
 import base64
 import csv
-try:
-    import pdfplumber
-except Exception:
-    pdfplumber = None
 
-def load_data() -> pd.DataFrame:
+# DB, plotly, scheduler and provider modules are imported inside the functions that use them,
+# so importing this module does no I/O and the layout can be served before any data work runs.
+
+COLUMNS = ['provider','timestamp','cost','service','subscription','resource_group','tags']
+
+def coerce_frame(df: pd.DataFrame) -> pd.DataFrame:
+    # Ensure required columns exist
+    expected = ['timestamp', 'cost', 'service']
+    for col in expected:
+        if col not in df.columns:
+            df[col] = '' if col != 'cost' else 0.0
+    # Coerce dtypes
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['cost'] = pd.to_numeric(df['cost'], errors='coerce').fillna(0.0)
+    # Optional columns
+    for col in ['provider', 'subscription', 'resource_group', 'tags']:
+        if col not in df.columns:
+            df[col] = ''
+    return df
+
+def load_cost_records() -> pd.DataFrame:
+    from db import get_session, CostRecord
+
+    session = get_session()
     try:
-        # Prefer DB if available, fallback to CSV
-        session = get_session()
         rows = session.query(CostRecord).all()
-        if rows:
-            df = pd.DataFrame([
-                {
-                    'provider': r.provider,
-                    'service': r.service,
-                    'cost': r.cost,
-                    'timestamp': r.timestamp,
-                    'subscription': r.subscription,
-                    'resource_group': r.resource_group,
-                    'tags': r.tags,
-                }
-                for r in rows
-            ])
-        else:
-            df = pd.read_csv('normalized_cost_data.csv')
-
-        # Ensure required columns exist
-        expected = ['timestamp', 'cost', 'service']
-        for col in expected:
-            if col not in df.columns:
-                df[col] = '' if col != 'cost' else 0.0
-        # Coerce dtypes
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['cost'] = pd.to_numeric(df['cost'], errors='coerce').fillna(0.0)
-        # Optional columns
-        for col in ['provider', 'subscription', 'resource_group', 'tags']:
-            if col not in df.columns:
-                df[col] = ''
-        return df
-    except Exception:
-        return pd.DataFrame(columns=['provider','timestamp','cost','service','subscription','resource_group','tags'])
+    finally:
+        session.close()
+    return coerce_frame(pd.DataFrame([
+        {
+            'provider': r.provider,
+            'service': r.service,
+            'cost': r.cost,
+            'timestamp': r.timestamp,
+            'subscription': r.subscription,
+            'resource_group': r.resource_group,
+            'tags': r.tags,
+        }
+        for r in rows
+    ], columns=COLUMNS))
 
-data = load_data()
+def load_monthly_records() -> pd.DataFrame:
+    from db import get_session, CostMonthlyRecord
+
+    session = get_session()
+    try:
+        rows = session.query(CostMonthlyRecord).all()
+    finally:
+        session.close()
+    return coerce_frame(pd.DataFrame([
+        {
+            'provider': m.provider,
+            'service': m.service,
+            'cost': m.cost,
+            'timestamp': m.month,
+            'subscription': m.subscription,
+            'resource_group': m.resource_group,
+            'tags': '',
+        }
+        for m in rows
+    ], columns=COLUMNS))
+
+def apply_filters(df: pd.DataFrame, start_date, end_date, filters) -> pd.DataFrame:
+    filters = filters or {}
+    return filter_frame(df, start_date, end_date, filters.get('provider'), filters.get('service'), filters.get('subscription'), filters.get('resource_group'))
+
+def load_history(monthly: pd.DataFrame, start_date=None, end_date=None, last_compacted_month=None, filters=None) -> pd.DataFrame:
+    from retention import load_archived_records, wants_archive_detail
+
+    # Monthly totals are stamped on the 1st, so a range starting mid-month still counts its first month
+    month_start = pd.to_datetime(start_date).to_period('M').to_timestamp() if start_date else None
+    # Compacted months come from monthly aggregates unless the user narrowed the range into them
+    archived = pd.DataFrame()
+    if not monthly.empty and wants_archive_detail(start_date, end_date, last_compacted_month):
+        archived = load_archived_records(start_date, end_date)
+    if archived.empty:
+        return apply_filters(monthly, month_start, end_date, filters)
+    covered = set(archived['timestamp'].dt.to_period('M'))
+    monthly = monthly[~monthly['timestamp'].dt.to_period('M').isin(covered)]
+    return pd.concat([
+        apply_filters(monthly, month_start, end_date, filters),
+        apply_filters(coerce_frame(archived.copy()), start_date, end_date, filters),
+    ], ignore_index=True)
+
+def load_data(start_date=None, end_date=None, filters=None) -> pd.DataFrame:
+    """Cost rows inside [start_date, end_date] matching filters, ready to chart."""
+    try:
+        from shared_cache import read_frame, snapshot_max, snapshot_rows
+
+        # Prefer DB if available, fallback to CSV. DB snapshots are shared across workers,
+        # rebuilt only when the data version changes, and only matching rows are copied out.
+        if snapshot_rows('cost_records', load_cost_records) or snapshot_rows('cost_monthly', load_monthly_records):
+            hot = read_frame('cost_records', load_cost_records, start_date, end_date, filters)
+            # Whether to open the archive depends on all compacted history, not just the selected range,
+            # so monthly rows are date-filtered only inside load_history
+            last = snapshot_max('cost_monthly', load_monthly_records)
+            monthly = read_frame('cost_monthly', load_monthly_records, filters=filters)
+            history = load_history(monthly, start_date, end_date, None if last is None else last.to_period('M'), filters)
+            return coerce_frame(pd.concat([history, hot], ignore_index=True))
+        return apply_filters(coerce_frame(pd.read_csv('normalized_cost_data.csv')), start_date, end_date, filters)
+    except Exception:
+        return pd.DataFrame(columns=COLUMNS)
 
 # Initialize Dash app
 app = dash.Dash(__name__)
@@ -65,7 +122,7 @@ app.layout = html.Div([
             html.Label('Provider'),
             dcc.Dropdown(
                 id='provider-select',
-                options=[{'label': p, 'value': p} for p in sorted([x for x in data['provider'].unique() if x]) or ['AWS','Azure']],
+                options=[],
                 value=None,
                 multi=True,
                 placeholder='Select provider(s)'
@@ -75,7 +132,7 @@ app.layout = html.Div([
             html.Label('Service'),
             dcc.Dropdown(
                 id='service-filter',
-                options=[{'label': s, 'value': s} for s in sorted([x for x in data['service'].unique() if isinstance(x, str)])],
+                options=[],
                 value=None,
                 multi=True,
                 placeholder='Filter by service'
@@ -85,7 +142,7 @@ app.layout = html.Div([
             html.Label('Subscription (Azure)'),
             dcc.Dropdown(
                 id='subscription-filter',
-                options=[{'label': s, 'value': s} for s in sorted([x for x in data['subscription'].unique() if isinstance(x, str) and x])],
+                options=[],
                 value=None,
                 multi=True,
                 placeholder='Filter by subscription'
@@ -95,7 +152,7 @@ app.layout = html.Div([
             html.Label('Resource Group (Azure)'),
             dcc.Dropdown(
                 id='rg-filter',
-                options=[{'label': s, 'value': s} for s in sorted([x for x in data['resource_group'].unique() if isinstance(x, str) and x])],
+                options=[],
                 value=None,
                 multi=True,
                 placeholder='Filter by resource group'
@@ -106,15 +163,15 @@ app.layout = html.Div([
     html.Div([
         dcc.DatePickerRange(
             id='date-picker',
-            start_date=(data['timestamp'].min() if not data.empty else None),
-            end_date=(data['timestamp'].max() if not data.empty else None),
+            start_date=None,
+            end_date=None,
             display_format='YYYY-MM-DD',
             style={'margin': '12px 0'}
         ),
         html.Button('Refresh data', id='refresh-btn', n_clicks=0, style={'marginLeft': '12px'}),
         dcc.Upload(
             id='upload-invoice',
-            children=html.Div(['Drag and Drop or ', html.A('Select Invoice CSV')]),
+            children=html.Div(['Drag and Drop or ', html.A('Select Invoice CSV/PDF')]),
             multiple=False,
             style={'marginLeft': '12px', 'display': 'inline-block', 'border': '1px dashed #999', 'padding': '6px 10px'}
         ),
@@ -168,6 +225,24 @@ app.layout = html.Div([
 ])
 
 # Callbacks for interactivity
+@app.callback(
+    [Output('provider-select', 'options'), Output('service-filter', 'options'), Output('subscription-filter', 'options'), Output('rg-filter', 'options'), Output('date-picker', 'start_date'), Output('date-picker', 'end_date')],
+    [Input('refresh-btn', 'n_clicks')]
+)
+def populate_filters(n_clicks):
+    # Runs on page load (and on Refresh), after the layout is already on screen
+    data = load_data()
+    options = [
+        [{'label': p, 'value': p} for p in sorted([x for x in data['provider'].unique() if x]) or ['AWS','Azure']],
+        [{'label': s, 'value': s} for s in sorted([x for x in data['service'].unique() if isinstance(x, str)])],
+        [{'label': s, 'value': s} for s in sorted([x for x in data['subscription'].unique() if isinstance(x, str) and x])],
+        [{'label': s, 'value': s} for s in sorted([x for x in data['resource_group'].unique() if isinstance(x, str) and x])],
+    ]
+    # Only seed the date range on first load; keep the user's selection on Refresh
+    if n_clicks or data.empty:
+        return options + [dash.no_update, dash.no_update]
+    return options + [data['timestamp'].min(), data['timestamp'].max()]
+
 def filter_frame(df: pd.DataFrame, start_date, end_date, providers, services, subs, rgs) -> pd.DataFrame:
     if df.empty:
         return df
@@ -188,12 +263,14 @@ def filter_frame(df: pd.DataFrame, start_date, end_date, providers, services, su
     [State('upload-invoice', 'filename')]
 )
 def update_all(start_date, end_date, providers, services, subs, rgs, _n, upload_contents, upload_name, download_clicks):
-    df = load_data()
+    import plotly.express as px
+
     providers = providers or []
     services = services or []
     subs = subs or []
     rgs = rgs or []
-    fdf = filter_frame(df, start_date, end_date, providers, services, subs, rgs)
+    # Already filtered: compacted months stamped on the 1st must not be dropped again by date
+    fdf = load_data(start_date, end_date, {'provider': providers, 'service': services, 'subscription': subs, 'resource_group': rgs})
 
     # Trend figure
     trend_fig = px.line(fdf, x='timestamp', y='cost', color='service', title='Spending Trends') if not fdf.empty else px.line(title='Spending Trends')
@@ -221,7 +298,9 @@ def update_all(start_date, end_date, providers, services, subs, rgs, _n, upload_
         reco_lines.append("No data available. Load data or adjust filters.")
 
     upload_msg = ''
-    if upload_contents and upload_name:
+    changed = dash.ctx.triggered_id if hasattr(dash, 'ctx') else dash.callback_context.triggered[0]['prop_id'].split('.')[0]
+    # Filter changes re-send the last upload's contents; only ingest when the upload itself fired
+    if upload_contents and upload_name and changed == 'upload-invoice':
         try:
             content_type, content_string = upload_contents.split(',')
             decoded = base64.b64decode(content_string)
@@ -239,28 +318,35 @@ def update_all(start_date, end_date, providers, services, subs, rgs, _n, upload_
                     'tags': ''
                 })
                 # Insert into DB
+                records = [
+                    {
+                        'provider': str(row['provider']),
+                        'service': str(row['service']),
+                        'cost': float(row['cost']),
+                        'timestamp': pd.to_datetime(row['timestamp']).to_pydatetime(),
+                        'subscription': str(row['subscription']),
+                        'resource_group': str(row['resource_group']),
+                        'tags': str(row['tags']),
+                    }
+                    for _, row in mapped.iterrows()
+                ]
+                from db import get_session, bulk_insert_cost_records
+
                 session = get_session()
                 try:
-                    for _, row in mapped.iterrows():
-                        rec = CostRecord(
-                            provider=str(row['provider']),
-                            service=str(row['service']),
-                            cost=float(row['cost']),
-                            timestamp=pd.to_datetime(row['timestamp']).to_pydatetime(),
-                            subscription=str(row['subscription']),
-                            resource_group=str(row['resource_group']),
-                            tags=str(row['tags']),
-                        )
-                        session.add(rec)
-                    session.commit()
+                    bulk_insert_cost_records(session, records)
                     upload_msg = f"Imported {len(mapped)} invoice rows from CSV."
                 finally:
                     session.close()
-            elif upload_name.lower().endswith('.pdf') and pdfplumber is not None:
-                with pdfplumber.open(io.BytesIO(decoded)) as pdf:
-                    page_text = "\n".join(page.extract_text() or '' for page in pdf.pages)
-                # Very basic PDF handling: not full parser, but stored for future mapping
-                upload_msg = f"PDF uploaded ({upload_name}). Extracted text length: {len(page_text)}."
+            elif upload_name.lower().endswith('.pdf'):
+                from invoice_ingest import enqueue_pdf_invoice, pdf_parser_available
+
+                if pdf_parser_available():
+                    # Table extraction runs on a process pool in the background; rows land in the DB when done
+                    job_id = enqueue_pdf_invoice(upload_name, decoded)
+                    upload_msg = f"PDF queued for parsing (invoice job {job_id}). Refresh once it finishes."
+                else:
+                    upload_msg = "PDF parser missing."
             else:
                 upload_msg = f"Unsupported file type or PDF parser missing."
         except Exception as e:
@@ -297,6 +383,8 @@ def integrations(aws_clicks, azure_clicks, fetch_clicks, akid, asecret, az_cid,
     az_msg = ''
     fetch_msg = ''
     changed = dash.ctx.triggered_id if hasattr(dash, 'ctx') else dash.callback_context.triggered[0]['prop_id'].split('.')[0]
+    from db import get_session, save_credentials
+
     session = get_session()
     try:
         if changed == 'save-aws' and aws_clicks:
@@ -324,7 +412,23 @@ def integrations(aws_clicks, azure_clicks, fetch_clicks, akid, asecret, az_cid,
 
     return aws_msg, az_msg, fetch_msg
 
-if __name__ == "__main__":
+def create_server():
+    """App factory for production serving, e.g. gunicorn -w 4 "cloud_cost_dashboard:create_server()".
+
+    Every worker calls this; only the one that wins the scheduler lock runs the
+    background jobs, and all of them read cost data through the shared cache.
+    """
+    from dotenv import load_dotenv
+
+    # Load .env before the scheduler imports modules that read their settings from the environment
+    load_dotenv()
+    from db import init_db
+    from scheduler import start_scheduler_if_elected
+
     init_db()
-    start_scheduler()
+    start_scheduler_if_elected()
+    return app.server
+
+if __name__ == "__main__":
+    create_server()
     app.run(debug=True, host="127.0.0.1", port=8050)
@@ -26,9 +26,6 @@ def normalize_to_frame(aws_json: Dict[str, Any], azure_json: Dict[str, Any]) ->
     azure_normalized = normalize_azure_data(azure_json)
     return pd.concat([aws_normalized, azure_normalized], ignore_index=True)
 
-aws_data = load_json_file('aws_cost_data.json')
-azure_data = load_json_file('azure_cost_data.json')
-
 # Normalize AWS Data
 def normalize_aws_data(data):
     normalized_data = []
@@ -95,6 +92,8 @@ def normalize_azure_data(data):
     return pd.DataFrame(normalized_data)
 
 if __name__ == '__main__':
+    aws_data = load_json_file('aws_cost_data.json')
+    azure_data = load_json_file('azure_cost_data.json')
     aws_normalized = normalize_aws_data(aws_data)
     azure_normalized = normalize_azure_data(azure_data)
     combined_data = pd.concat([aws_normalized, azure_normalized], ignore_index=True)
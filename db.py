@@ -1,12 +1,14 @@
 from __future__ import annotations
 
-from typing import Optional
+import os
+from typing import Dict, List, Optional
 from datetime import datetime
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Index
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Index, inspect, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./cloud_costs.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("COST_DB_URL", "sqlite:///./cloud_costs.db")
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
@@ -19,28 +21,169 @@ Base = declarative_base()
 class CostRecord(Base):
     __tablename__ = "cost_records"
 
-    id = Column(Integer, primary_key=True, index=True)
-    provider = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    # provider lookups are served by the leading column of ix_cost_api_unique
+    provider = Column(String)
     service = Column(String, index=True)
     cost = Column(Float)
     timestamp = Column(DateTime, index=True)
     subscription = Column(String, default="", index=True)
     resource_group = Column(String, default="", index=True)
     tags = Column(String, default="")
+    # 'api' for fetched rows, 'invoice' for uploaded line items; init_db adopts older rows as 'api'
+    source = Column(String, default="", server_default="")
 
     __table_args__ = (
-        Index("ix_cost_unique", "provider", "service", "timestamp", "subscription", "resource_group"),
+        # Only fetched rows are one fact per key; invoice lines may legitimately share it
+        Index(
+            "ix_cost_api_unique", "provider", "service", "timestamp", "subscription", "resource_group",
+            unique=True, sqlite_where=text("source = 'api'"),
+        ),
     )
 
 
+class CostMonthlyRecord(Base):
+    """Monthly aggregate of daily cost_records rows that aged past retention."""
+
+    __tablename__ = "cost_monthly"
+
+    id = Column(Integer, primary_key=True)
+    provider = Column(String, default="")
+    service = Column(String, default="")
+    month = Column(DateTime)
+    subscription = Column(String, default="")
+    resource_group = Column(String, default="")
+    cost = Column(Float, default=0.0)
+
+    __table_args__ = (
+        Index("ix_cost_monthly_unique", "provider", "service", "month", "subscription", "resource_group", unique=True),
+    )
+
+
+class InvoiceJob(Base):
+    """Uploaded invoice waiting for (or done with) background parsing."""
+
+    __tablename__ = "invoice_jobs"
+
+    id = Column(Integer, primary_key=True)
+    filename = Column(String, default="")
+    path = Column(String, default="")
+    status = Column(String, default="pending", index=True)  # pending | running | done | failed
+    rows = Column(Integer, default=0)
+    error = Column(String, default="")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class DataVersion(Base):
+    """Single-row counter bumped whenever cost data changes; cached frames are keyed by it."""
+
+    __tablename__ = "data_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Indexes older databases still carry but the model no longer declares; each one slows every insert
+REDUNDANT_INDEXES = ['ix_cost_records_id', 'ix_cost_records_provider', 'ix_cost_unique']
+
+
 def init_db() -> None:
     Base.metadata.create_all(bind=engine)
+    _migrate_cost_records()
+
+
+def _migrate_cost_records() -> None:
+    # create_all only creates missing tables; bring older cost_records tables up to the model
+    with engine.begin() as conn:
+        columns = {c['name'] for c in inspect(conn).get_columns('cost_records')}
+        if 'source' not in columns:
+            conn.execute(text("ALTER TABLE cost_records ADD COLUMN source VARCHAR DEFAULT ''"))
+        for name in REDUNDANT_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        _adopt_legacy_rows(conn)
+        for index in CostRecord.__table__.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+def _adopt_legacy_rows(conn) -> None:
+    """Turn rows stored before the source column existed into API rows, one per key.
+
+    The old fetch used session.merge without an id, so every run stored the same
+    key again. Keep the newest copy of each key, or the API row a later fetch already
+    stored, then mark the survivors 'api' so fetches update them in place.
+    """
+    legacy = "COALESCE(source, '') = ''"
+    if conn.execute(text(f"SELECT 1 FROM cost_records WHERE {legacy} LIMIT 1")).first() is None:
+        return
+    conn.execute(text(
+        f"""
+        DELETE FROM cost_records WHERE {legacy} AND EXISTS (
+            SELECT 1 FROM cost_records AS other
+            WHERE other.provider IS cost_records.provider
+              AND other.service IS cost_records.service
+              AND other.timestamp IS cost_records.timestamp
+              AND other.subscription IS cost_records.subscription
+              AND other.resource_group IS cost_records.resource_group
+              AND (other.source = 'api' OR (COALESCE(other.source, '') = '' AND other.id > cost_records.id))
+        )
+        """
+    ))
+    conn.execute(text(f"UPDATE cost_records SET source = 'api' WHERE {legacy}"))
 
 
 def get_session() -> Session:
     return SessionLocal()
 
 
+def bump_data_version(session: Session) -> None:
+    """Mark cost data as changed; committed together with the caller's writes."""
+    updated = (
+        session.query(DataVersion)
+        .filter(DataVersion.id == 1)
+        .update({DataVersion.version: DataVersion.version + 1, DataVersion.updated_at: datetime.utcnow()}, synchronize_session=False)
+    )
+    if not updated:
+        session.add(DataVersion(id=1, version=1))
+
+
+def upsert_api_cost_records(session: Session, records: List[Dict]) -> int:
+    """Insert fetched rows, updating cost and tags of API rows already stored under the same key.
+
+    Relies on ix_cost_api_unique, so concurrent fetches cannot insert the same key twice.
+    """
+    if records:
+        table = CostRecord.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['provider', 'service', 'timestamp', 'subscription', 'resource_group'],
+            index_where=text("source = 'api'"),
+            set_={'cost': stmt.excluded.cost, 'tags': stmt.excluded.tags},
+        )
+        session.execute(stmt, [dict(r, source='api') for r in records])
+        bump_data_version(session)
+        session.commit()
+    return len(records)
+
+
+def get_data_version(session: Session) -> int:
+    row = session.get(DataVersion, 1)
+    return row.version if row else 0
+
+
+def bulk_insert_cost_records(session: Session, records: List[Dict], source: str = "invoice") -> int:
+    """Insert normalized cost rows in one executemany instead of one ORM object per row.
+
+    Rows are appended as-is; invoice lines sharing a key are separate charges.
+    """
+    if records:
+        session.bulk_insert_mappings(CostRecord, [dict(r, source=source) for r in records])
+        bump_data_version(session)
+        session.commit()
+    return len(records)
+
+
 class CloudCredential(Base):
     __tablename__ = "cloud_credentials"
 
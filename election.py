@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import os
+from typing import IO, Optional
+
+# Workers sharing this lock file elect one of them to run the scheduler
+SCHEDULER_LOCK_FILE = os.getenv("SCHEDULER_LOCK_FILE", "./scheduler.lock")
+
+_lock_handle: Optional[IO] = None
+_is_scheduler_process = False
+
+
+def try_acquire_scheduler_lock() -> bool:
+    """Take the scheduler lock without blocking; True if this process now holds it.
+
+    The handle stays open for the life of the process, and the OS releases the
+    lock when the process exits.
+    """
+    global _lock_handle
+    if _lock_handle is not None:
+        return True
+    handle = open(SCHEDULER_LOCK_FILE, 'a+')
+    try:
+        if os.name == 'nt':
+            import msvcrt
+
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    handle.seek(0)
+    handle.truncate()
+    handle.write(str(os.getpid()))
+    handle.flush()
+    _lock_handle = handle
+    return True
+
+
+def mark_scheduler_process() -> None:
+    global _is_scheduler_process
+    _is_scheduler_process = True
+
+
+def is_scheduler_process() -> bool:
+    """True in the process running the background scheduler (elected or started directly)."""
+    return _is_scheduler_process
+
+
+__all__ = ["try_acquire_scheduler_lock", "mark_scheduler_process", "is_scheduler_process", "SCHEDULER_LOCK_FILE"]
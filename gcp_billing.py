@@ -1,13 +1,11 @@
 from dotenv import load_dotenv
 import os
 
-# Load environment variables from .env file
-load_dotenv()
-
-import os
-from google.cloud import bigquery
-
 def get_gcp_costs():
+    from google.cloud import bigquery
+
+    # Load environment variables from .env file
+    load_dotenv()
     # Path to the JSON key file, stored in an environment variable
     gcp_key_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
     
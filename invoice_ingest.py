@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import importlib.util
+import multiprocessing
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from db import init_db, get_session, InvoiceJob, bulk_insert_cost_records
+from election import is_scheduler_process
+
+# Uploaded PDFs are kept on disk until parsed so a restart does not lose them
+INVOICE_DIR = os.getenv("INVOICE_DIR", "./invoices")
+# Worker processes used to extract tables; defaults to one per CPU
+PARSE_WORKERS = int(os.getenv("INVOICE_PARSE_WORKERS", "0")) or (os.cpu_count() or 1)
+# Pages handed to a worker per task; larger chunks mean fewer reopenings of the PDF
+PAGES_PER_TASK = 8
+
+# Header cell (lower-cased, parentheticals stripped) -> normalized column
+COLUMN_ALIASES = {
+    'service': ('service', 'service name', 'description', 'product', 'product name', 'item', 'meter', 'meter category'),
+    'cost': ('cost', 'amount', 'total', 'charges', 'charge', 'extended price', 'line total', 'price'),
+    'timestamp': ('date', 'usage date', 'billing period', 'period', 'service period', 'invoice date'),
+    'subscription': ('subscription', 'subscription id', 'subscription name', 'account', 'account id'),
+    'resource_group': ('resource group', 'resourcegroup', 'resource_group'),
+    'provider': ('provider', 'cloud', 'vendor'),
+}
+# Summary lines repeat the sum of the line items and would double count
+SUMMARY_PREFIXES = ('total', 'subtotal', 'sub-total', 'tax', 'vat', 'balance', 'amount due')
+PROVIDER_MARKERS = (
+    ('Amazon Web Services', 'AWS'), ('AWS', 'AWS'),
+    ('Microsoft Azure', 'Azure'), ('Azure', 'Azure'),
+    ('Google Cloud', 'GCP'),
+)
+
+_runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='invoice-jobs')
+
+
+def pdf_parser_available() -> bool:
+    return importlib.util.find_spec("pdfplumber") is not None
+
+
+def _extract_pages(path: str, page_numbers: List[int]) -> List[Tuple[int, List[List[List[Optional[str]]]], str]]:
+    """Worker task: raw tables for the given pages, plus text for the first page only."""
+    import pdfplumber
+
+    out = []
+    with pdfplumber.open(path) as pdf:
+        for number in page_numbers:
+            page = pdf.pages[number]
+            text = (page.extract_text() or '') if number == 0 else ''
+            out.append((number, page.extract_tables(), text))
+    return out
+
+
+def extract_pdf_pages(path: str, max_workers: Optional[int] = None) -> List[Tuple[int, List, str]]:
+    """Extract tables page by page on a process pool, returned in page order."""
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        page_count = len(pdf.pages)
+    chunks = [list(range(i, min(i + PAGES_PER_TASK, page_count))) for i in range(0, page_count, PAGES_PER_TASK)]
+    workers = min(max_workers or PARSE_WORKERS, len(chunks))
+    if workers <= 1:
+        pages = [p for chunk in chunks for p in _extract_pages(path, chunk)]
+    else:
+        # spawn keeps workers clear of locks held by the server's threads at fork time
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            pages = [p for result in pool.map(_extract_pages, [path] * len(chunks), chunks) for p in result]
+    return sorted(pages, key=lambda p: p[0])
+
+
+def _clean(cell) -> str:
+    return re.sub(r'\s+', ' ', str(cell or '')).strip()
+
+
+def _match_header(row: List[Optional[str]]) -> Optional[Dict[str, int]]:
+    mapping: Dict[str, int] = {}
+    for idx, cell in enumerate(row):
+        name = re.sub(r'\(.*?\)', '', _clean(cell).lower()).strip(' :')
+        for col, aliases in COLUMN_ALIASES.items():
+            if col not in mapping and name in aliases:
+                mapping[col] = idx
+                break
+    return mapping if 'service' in mapping and 'cost' in mapping else None
+
+
+def _parse_amount(value) -> Optional[float]:
+    text = _clean(value)
+    negative = (text.startswith('(') and text.endswith(')')) or text.startswith('-')
+    digits = re.sub(r'[^0-9.]', '', text)
+    if not digits or digits.count('.') > 1:
+        return None
+    amount = float(digits)
+    return -amount if negative else amount
+
+
+def detect_provider(text: str) -> str:
+    for marker, provider in PROVIDER_MARKERS:
+        if marker in text:
+            return provider
+    return 'Unknown'
+
+
+def detect_invoice_date(text: str) -> Optional[datetime]:
+    match = re.search(r'(?:invoice|billing|statement)\s+date\s*[:\-]?\s*([^\n]+)', text, re.IGNORECASE)
+    if not match:
+        return None
+    parsed = pd.to_datetime(match.group(1).strip(), errors='coerce')
+    return None if pd.isna(parsed) else parsed.to_pydatetime()
+
+
+def map_tables_to_records(pages: List[Tuple[int, List, str]], default_provider: str = 'Unknown',
+                          default_timestamp: Optional[datetime] = None) -> pd.DataFrame:
+    """Map extracted line-item tables to the normalized cost schema.
+
+    Tables without a recognizable header reuse the last header seen with the same
+    column count, which covers line-item tables continuing across page breaks.
+    """
+    default_timestamp = default_timestamp or datetime.today()
+    header: Optional[Dict[str, int]] = None
+    width = 0
+    records = []
+    for _, tables, _ in pages:
+        for table in tables:
+            if not table:
+                continue
+            start = 0
+            found = _match_header(table[0])
+            if found:
+                header, width, start = found, len(table[0]), 1
+            elif header is None or len(table[0]) != width:
+                continue
+            for row in table[start:]:
+                if len(row) != width:
+                    continue
+                service = _clean(row[header['service']])
+                cost = _parse_amount(row[header['cost']])
+                if not service or cost is None or service.lower().startswith(SUMMARY_PREFIXES):
+                    continue
+                timestamp = default_timestamp
+                if 'timestamp' in header:
+                    parsed = pd.to_datetime(_clean(row[header['timestamp']]), errors='coerce')
+                    if not pd.isna(parsed):
+                        timestamp = parsed.to_pydatetime()
+                records.append({
+                    'provider': _clean(row[header['provider']]) if 'provider' in header else default_provider,
+                    'service': service,
+                    'cost': cost,
+                    'timestamp': timestamp,
+                    'subscription': _clean(row[header['subscription']]) if 'subscription' in header else '',
+                    'resource_group': _clean(row[header['resource_group']]) if 'resource_group' in header else '',
+                    'tags': '',
+                })
+    return pd.DataFrame(records, columns=['provider', 'service', 'cost', 'timestamp', 'subscription', 'resource_group', 'tags'])
+
+
+def parse_pdf_invoice(path: str, max_workers: Optional[int] = None) -> pd.DataFrame:
+    pages = extract_pdf_pages(path, max_workers=max_workers)
+    first_text = pages[0][2] if pages else ''
+    return map_tables_to_records(pages, detect_provider(first_text), detect_invoice_date(first_text))
+
+
+def enqueue_pdf_invoice(filename: str, content: bytes) -> int:
+    """Store an uploaded PDF and queue it for background parsing; returns the job id."""
+    init_db()
+    os.makedirs(INVOICE_DIR, exist_ok=True)
+    path = os.path.join(INVOICE_DIR, f"{uuid.uuid4().hex}.pdf")
+    with open(path, 'wb') as f:
+        f.write(content)
+    session = get_session()
+    try:
+        job = InvoiceJob(filename=filename, path=path)
+        session.add(job)
+        session.commit()
+        job_id = job.id
+    finally:
+        session.close()
+    # Jobs only run where the scheduler runs, so requeue_interrupted_jobs never races
+    # a live worker; other processes leave the job to the scheduler's sweep.
+    if is_scheduler_process():
+        _runner.submit(process_invoice_job, job_id)
+    return job_id
+
+
+def _claim(job_id: int) -> Optional[str]:
+    # Conditional update so a job picked up by the sweep and the upload thread runs once
+    session = get_session()
+    try:
+        claimed = (
+            session.query(InvoiceJob)
+            .filter(InvoiceJob.id == job_id, InvoiceJob.status == 'pending')
+            .update({'status': 'running'}, synchronize_session=False)
+        )
+        session.commit()
+        return session.get(InvoiceJob, job_id).path if claimed else None
+    finally:
+        session.close()
+
+
+def process_invoice_job(job_id: int) -> None:
+    path = _claim(job_id)
+    if path is None:
+        return
+    status, rows, error = 'done', 0, ''
+    try:
+        df = parse_pdf_invoice(path)
+        session = get_session()
+        try:
+            rows = bulk_insert_cost_records(session, df.to_dict('records'))
+        finally:
+            session.close()
+        print(f"Invoice job {job_id}: imported {rows} rows.")
+    except Exception as e:
+        status, error = 'failed', str(e)
+        print(f"Invoice job {job_id} failed: {e}")
+
+    session = get_session()
+    try:
+        job = session.get(InvoiceJob, job_id)
+        job.status, job.rows, job.error, job.finished_at = status, rows, error, datetime.utcnow()
+        session.commit()
+    finally:
+        session.close()
+    if status == 'done':
+        os.remove(path)
+
+
+def process_pending_invoices() -> None:
+    """Scheduler sweep: parse any invoice still queued, e.g. after a restart."""
+    init_db()
+    session = get_session()
+    try:
+        job_ids = [j.id for j in session.query(InvoiceJob.id).filter(InvoiceJob.status == 'pending').order_by(InvoiceJob.id)]
+    finally:
+        session.close()
+    for job_id in job_ids:
+        process_invoice_job(job_id)
+
+
+def requeue_interrupted_jobs() -> int:
+    """Put jobs left 'running' by a stopped process back in the queue."""
+    init_db()
+    session = get_session()
+    try:
+        count = (
+            session.query(InvoiceJob)
+            .filter(InvoiceJob.status == 'running')
+            .update({'status': 'pending'}, synchronize_session=False)
+        )
+        session.commit()
+        return count
+    finally:
+        session.close()
+
+
+__all__ = [
+    "enqueue_pdf_invoice",
+    "parse_pdf_invoice",
+    "map_tables_to_records",
+    "process_pending_invoices",
+    "requeue_interrupted_jobs",
+]
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import glob
+import importlib.util
+import os
+import uuid
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from db import engine, init_db, get_session, bump_data_version, CostRecord, CostMonthlyRecord
+
+# Daily rows older than this many days are archived and collapsed into monthly aggregates
+RETENTION_DAYS = int(os.getenv("COST_RETENTION_DAYS", "90"))
+# Root folder for compressed Parquet archives of raw daily rows
+ARCHIVE_DIR = os.getenv("COST_ARCHIVE_DIR", "./archive")
+# Archived daily detail replaces monthly totals only for ranges this short, lying within compacted months
+ARCHIVE_DETAIL_MAX_MONTHS = int(os.getenv("COST_ARCHIVE_DETAIL_MONTHS", "3"))
+
+KEY_COLUMNS = ['provider', 'service', 'subscription', 'resource_group']
+
+
+def archive_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _archive_root() -> str:
+    return os.path.join(ARCHIVE_DIR, 'cost_records')
+
+
+def retention_cutoff(retention_days: Optional[int] = None) -> datetime:
+    """First day of the month containing the retention horizon.
+
+    Only whole months are compacted, so a monthly aggregate never overlaps
+    daily rows still kept in the hot table.
+    """
+    days = RETENTION_DAYS if retention_days is None else retention_days
+    horizon = date.today() - timedelta(days=days)
+    return datetime.combine(horizon.replace(day=1), time.min)
+
+
+def _write_archive(old: pd.DataFrame) -> list:
+    # Random suffix so two runs within the same second never overwrite each other's files
+    stamp = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    written = []
+    for month, part in old.groupby(old['timestamp'].dt.to_period('M')):
+        month_dir = os.path.join(_archive_root(), str(month))
+        os.makedirs(month_dir, exist_ok=True)
+        path = os.path.join(month_dir, f'part-{stamp}.parquet')
+        part.to_parquet(path, index=False, compression='zstd')
+        written.append(path)
+    return written
+
+
+def _reclaim_space() -> None:
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        mode = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode != 2:
+            # auto_vacuum can only be switched on an existing file by one full VACUUM
+            cursor.executescript("PRAGMA auto_vacuum = INCREMENTAL; VACUUM;")
+        else:
+            # executescript steps the pragma to completion; execute() would free a single page
+            cursor.executescript("PRAGMA incremental_vacuum;")
+        cursor.close()
+    finally:
+        raw.close()
+
+
+def compact_cost_records(retention_days: Optional[int] = None) -> Dict[str, int]:
+    """Archive and compact cost_records, then reclaim free pages.
+
+    Fetched rows are kept unique by ix_cost_api_unique at write time, so every
+    row here is a separate charge and total cost is preserved.
+    Returns counts of archived rows and monthly aggregates touched.
+    """
+    init_db()
+    stats = {'archived': 0, 'monthly': 0}
+    cutoff = retention_cutoff(retention_days)
+    table = CostRecord.__table__
+
+    old = pd.read_sql(select(table).where(table.c.timestamp < cutoff), engine)
+    if not old.empty:
+        if not archive_available():
+            # Raw history is never dropped without an archive copy
+            print("Compaction skipped: pyarrow is required to archive raw cost records.")
+        else:
+            old['timestamp'] = pd.to_datetime(old['timestamp'])
+            for col in KEY_COLUMNS:
+                old[col] = old[col].fillna('')
+            old['cost'] = pd.to_numeric(old['cost'], errors='coerce').fillna(0.0)
+
+            monthly = old.assign(month=old['timestamp'].dt.to_period('M').dt.to_timestamp())
+            monthly = monthly.groupby(KEY_COLUMNS + ['month'])['cost'].sum().reset_index()
+
+            last_id = int(old['id'].max())
+            written = _write_archive(old)
+            try:
+                monthly_table = CostMonthlyRecord.__table__
+                stmt = sqlite_insert(monthly_table)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['provider', 'service', 'month', 'subscription', 'resource_group'],
+                    set_={'cost': monthly_table.c.cost + stmt.excluded.cost},
+                )
+                with engine.begin() as conn:
+                    conn.execute(stmt, monthly.to_dict('records'))
+                    # Bound by the ids read above so rows inserted meanwhile are not lost unarchived
+                    conn.execute(delete(table).where(table.c.timestamp < cutoff, table.c.id <= last_id))
+            except Exception:
+                for path in written:
+                    os.remove(path)
+                raise
+            stats['archived'] = len(old)
+            stats['monthly'] = len(monthly)
+
+    if stats['archived']:
+        session = get_session()
+        try:
+            bump_data_version(session)
+            session.commit()
+        finally:
+            session.close()
+    _reclaim_space()
+    print(
+        f"Compaction done: {stats['archived']} rows archived into {stats['monthly']} monthly aggregates."
+    )
+    return stats
+
+
+def wants_archive_detail(start_date, end_date, last_compacted_month) -> bool:
+    """True when the user narrowed the range into compacted history.
+
+    Broad ranges (including the default full range) are served from cost_monthly,
+    so dashboard cost does not grow with the size of the archive.
+    """
+    if not start_date or not end_date or last_compacted_month is None:
+        return False
+    first = pd.to_datetime(start_date).to_period('M')
+    last = pd.to_datetime(end_date).to_period('M')
+    return last <= last_compacted_month and (last - first).n < ARCHIVE_DETAIL_MAX_MONTHS
+
+
+@lru_cache(maxsize=8)
+def _read_archive_files(files: Tuple[Tuple[str, float], ...]) -> pd.DataFrame:
+    # Keyed by (path, mtime) pairs so a compaction run that adds files invalidates the entry
+    archived = pd.concat([pd.read_parquet(path) for path, _ in files], ignore_index=True)
+    archived['timestamp'] = pd.to_datetime(archived['timestamp'])
+    return archived.drop(columns=['id'], errors='ignore')
+
+
+def load_archived_records(start_date=None, end_date=None) -> pd.DataFrame:
+    """Read archived daily rows for the months overlapping [start_date, end_date].
+
+    Only the month folders inside the range are opened, and the last few reads
+    are cached; treat the result as read-only.
+    """
+    root = _archive_root()
+    if not os.path.isdir(root) or not archive_available():
+        return pd.DataFrame()
+    first = pd.to_datetime(start_date).to_period('M') if start_date else None
+    last = pd.to_datetime(end_date).to_period('M') if end_date else None
+    files = []
+    for name in sorted(os.listdir(root)):
+        try:
+            month = pd.Period(name, freq='M')
+        except Exception:
+            continue
+        if (first is not None and month < first) or (last is not None and month > last):
+            continue
+        for path in sorted(glob.glob(os.path.join(root, name, '*.parquet'))):
+            files.append((path, os.path.getmtime(path)))
+    if not files:
+        return pd.DataFrame()
+    return _read_archive_files(tuple(files))
+
+
+__all__ = ["compact_cost_records", "load_archived_records", "retention_cutoff", "wants_archive_detail"]
@@ -1,17 +1,24 @@
 from __future__ import annotations
 
 import os
+import threading
 from datetime import date, timedelta
-from typing import List, Dict
-
-from apscheduler.schedulers.background import BackgroundScheduler
+from typing import List, Dict, Optional, TYPE_CHECKING
 
 from aws_cost_explorer import get_aws_costs
 from azure_cost_management import get_azure_costs
 from data_normalization import normalize_to_frame
-from db import init_db, get_session, CostRecord, get_latest_credentials
+from db import init_db, get_session, get_latest_credentials, upsert_api_cost_records
+from retention import compact_cost_records
+from invoice_ingest import process_pending_invoices, requeue_interrupted_jobs
+from election import try_acquire_scheduler_lock, mark_scheduler_process
 import pandas as pd
 
+if TYPE_CHECKING:
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+_scheduler: Optional[BackgroundScheduler] = None
+
 
 def fetch_and_persist() -> None:
     start = date.today().replace(day=1)
@@ -51,30 +58,57 @@ def fetch_and_persist() -> None:
         print("No data fetched to persist.")
         return
 
+    records = [
+        {
+            'provider': str(row.get('provider') or ''),
+            'service': str(row.get('service') or ''),
+            'cost': float(row.get('cost') or 0.0),
+            'timestamp': pd.to_datetime(row.get('timestamp')).to_pydatetime(),
+            'subscription': str(row.get('subscription') or ''),
+            'resource_group': str(row.get('resource_group') or ''),
+            'tags': str(row.get('tags') or ''),
+        }
+        for _, row in df.iterrows()
+    ]
     session = get_session()
     try:
-        for _, row in df.iterrows():
-            rec = CostRecord(
-                provider=str(row.get('provider') or ''),
-                service=str(row.get('service') or ''),
-                cost=float(row.get('cost') or 0.0),
-                timestamp=pd.to_datetime(row.get('timestamp')).to_pydatetime(),
-                subscription=str(row.get('subscription') or ''),
-                resource_group=str(row.get('resource_group') or ''),
-                tags=str(row.get('tags') or ''),
-            )
-            session.merge(rec)
-        session.commit()
+        # Month-to-date fetches repeat every run; update in place instead of appending duplicates
+        upsert_api_cost_records(session, records)
         print(f"Persisted {len(df)} records.")
     finally:
         session.close()
 
 
 def start_scheduler() -> BackgroundScheduler:
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    global _scheduler
     init_db()
+    mark_scheduler_process()
+    requeue_interrupted_jobs()
     scheduler = BackgroundScheduler()
     scheduler.add_job(fetch_and_persist, 'interval', minutes=30, id='fetch_costs', replace_existing=True)
+    scheduler.add_job(compact_cost_records, 'cron', hour=3, id='compact_costs', replace_existing=True)
+    scheduler.add_job(process_pending_invoices, 'interval', seconds=15, id='invoice_jobs', replace_existing=True, max_instances=1)
     scheduler.start()
-    print("Scheduler started: fetch job every 30 minutes")
+    _scheduler = scheduler
+    print("Scheduler started: fetch job every 30 minutes, compaction daily at 03:00, invoice queue every 15 seconds")
     return scheduler
 
+
+def start_scheduler_if_elected(retry_seconds: int = 60) -> Optional[BackgroundScheduler]:
+    """Start the scheduler only in the process holding the election lock.
+
+    The OS drops the lock when the holder exits, and processes that lost the
+    election retry every retry_seconds, so another one takes over.
+    """
+    if _scheduler is not None:
+        return _scheduler
+    if not try_acquire_scheduler_lock():
+        timer = threading.Timer(retry_seconds, start_scheduler_if_elected, kwargs={'retry_seconds': retry_seconds})
+        timer.daemon = True
+        timer.start()
+        return None
+    print(f"Process {os.getpid()} elected to run the scheduler.")
+    return start_scheduler()
+
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import glob
+import importlib.util
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from db import get_session, get_data_version
+
+# Snapshots shared by all workers: one uncompressed Arrow IPC file per frame and data version.
+# Each worker keeps the file memory-mapped, so the rows live once in the OS page cache and
+# only the rows a request asks for are copied into pandas. Without pyarrow the snapshot is
+# a pickle and each worker holds its own DataFrame copy.
+CACHE_DIR = os.getenv("COST_CACHE_DIR", "./cache")
+
+_memo: Dict[str, Tuple[int, Any]] = {}
+_lock = threading.Lock()
+
+
+def _use_arrow() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _snapshot_path(name: str, version: int) -> str:
+    suffix = 'arrow' if _use_arrow() else 'pkl'
+    return os.path.join(CACHE_DIR, f"{name}-v{version}.{suffix}")
+
+
+def _open_snapshot(path: str) -> Any:
+    """Memory-mapped Arrow table (zero-copy) or, for pickles, a DataFrame; None if unreadable."""
+    if not os.path.exists(path):
+        return None
+    try:
+        if path.endswith('.arrow'):
+            import pyarrow as pa
+
+            # Left open on purpose: the table's buffers point into the mapping
+            return pa.ipc.open_file(pa.memory_map(path)).read_all()
+        return pd.read_pickle(path)
+    except Exception:
+        # Half-written or foreign file; rebuild it from the DB
+        return None
+
+
+def _write_snapshot(path: str, frame: pd.DataFrame) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if path.endswith('.arrow'):
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        frame.to_pickle(tmp)
+    # Atomic swap so readers in other workers never see a partial snapshot
+    os.replace(tmp, path)
+
+
+def _remove_stale(name: str, version: int) -> None:
+    keep = os.path.basename(_snapshot_path(name, version))
+    for path in glob.glob(os.path.join(CACHE_DIR, f"{name}-v*")):
+        if os.path.basename(path) != keep and not path.endswith('.tmp'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def current_version() -> int:
+    session = get_session()
+    try:
+        return get_data_version(session)
+    finally:
+        session.close()
+
+
+def _snapshot(name: str, loader: Callable[[], pd.DataFrame]) -> Any:
+    version = current_version()
+    hit = _memo.get(name)
+    if hit and hit[0] == version:
+        return hit[1]
+    with _lock:
+        hit = _memo.get(name)
+        if hit and hit[0] == version:
+            return hit[1]
+        path = _snapshot_path(name, version)
+        source = _open_snapshot(path)
+        if source is None:
+            frame = loader()
+            try:
+                _write_snapshot(path, frame)
+                _remove_stale(name, version)
+                source = _open_snapshot(path)
+            except Exception as e:
+                print(f"Could not write cache snapshot {path}: {e}")
+            # Map the snapshot just written rather than keeping the loader's private copy
+            source = frame if source is None else source
+        _memo[name] = (version, source)
+        return source
+
+
+def snapshot_rows(name: str, loader: Callable[[], pd.DataFrame]) -> int:
+    source = _snapshot(name, loader)
+    return len(source) if isinstance(source, pd.DataFrame) else source.num_rows
+
+
+def snapshot_max(name: str, loader: Callable[[], pd.DataFrame], column: str = 'timestamp') -> Optional[pd.Timestamp]:
+    """Largest value of column over the whole snapshot, computed without copying rows; None if empty."""
+    source = _snapshot(name, loader)
+    if isinstance(source, pd.DataFrame):
+        value = source[column].max() if len(source) else None
+    else:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        # Snapshot of an empty frame has untyped columns
+        empty = source.num_rows == 0 or pa.types.is_null(source.schema.field(column).type)
+        value = None if empty else pc.max(source[column]).as_py()
+    return None if value is None or pd.isna(value) else pd.Timestamp(value)
+
+
+def _arrow_mask(table, start_date, end_date, filters: Dict[str, List]):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    mask = None
+
+    def both(a, b):
+        return b if a is None else pc.and_(a, b)
+
+    if start_date and end_date:
+        ts_type = table.schema.field('timestamp').type
+        start = pa.scalar(pd.to_datetime(start_date).to_pydatetime(), type=ts_type)
+        end = pa.scalar(pd.to_datetime(end_date).to_pydatetime(), type=ts_type)
+        mask = both(mask, pc.and_(pc.greater_equal(table['timestamp'], start), pc.less_equal(table['timestamp'], end)))
+    for col, values in filters.items():
+        if not values:
+            continue
+        col_type = table.schema.field(col).type
+        if pa.types.is_null(col_type):
+            # Snapshot of an empty frame has untyped columns; nothing can match
+            mask = both(mask, pc.is_valid(table[col]))
+        else:
+            mask = both(mask, pc.is_in(table[col], value_set=pa.array(values, type=col_type)))
+    return mask
+
+
+def read_frame(name: str, loader: Callable[[], pd.DataFrame], start_date=None, end_date=None,
+               filters: Optional[Dict[str, List]] = None) -> pd.DataFrame:
+    """Rows of the cached frame inside [start_date, end_date] whose columns match filters.
+
+    The snapshot is built at most once per data version across workers. The returned
+    DataFrame is a private copy of just the matching rows.
+    """
+    filters = filters or {}
+    source = _snapshot(name, loader)
+    if isinstance(source, pd.DataFrame):
+        mask = pd.Series(True, index=source.index)
+        if start_date and end_date:
+            mask &= (source['timestamp'] >= pd.to_datetime(start_date)) & (source['timestamp'] <= pd.to_datetime(end_date))
+        for col, values in filters.items():
+            if values:
+                mask &= source[col].isin(values)
+        return source[mask].copy()
+    mask = _arrow_mask(source, start_date, end_date, filters)
+    return (source if mask is None else source.filter(mask)).to_pandas()
+
+
+__all__ = ["read_frame", "snapshot_rows", "snapshot_max", "current_version"]
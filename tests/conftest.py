@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Point db.py at a throwaway SQLite file before anything imports it
+os.environ["COST_DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='cloud-costs-'), 'test.db')}"
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def fresh_db():
+    db.Base.metadata.drop_all(bind=db.engine)
+    db.init_db()
+    yield db
+
+
+@pytest.fixture
+def session(fresh_db):
+    s = fresh_db.get_session()
+    yield s
+    s.close()
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('dash')
+pytest.importorskip('pyarrow')
+
+import cloud_cost_dashboard  # noqa: E402
+import retention  # noqa: E402
+import shared_cache  # noqa: E402
+from db import upsert_api_cost_records  # noqa: E402
+
+
+@pytest.fixture
+def compacted_march(session, tmp_path, monkeypatch):
+    """March 2024 as 31 daily API rows of 1.0, compacted into a monthly aggregate and the archive."""
+    monkeypatch.setattr(retention, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    monkeypatch.setattr(shared_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(shared_cache, '_memo', {})
+    upsert_api_cost_records(session, [
+        {
+            'provider': 'AWS', 'service': 'Amazon EC2', 'cost': 1.0,
+            'timestamp': datetime(2024, 3, 1) + timedelta(days=day),
+            'subscription': '', 'resource_group': '', 'tags': '',
+        }
+        for day in range(31)
+    ])
+    assert retention.compact_cost_records()['archived'] == 31
+
+
+def test_mid_month_range_reads_archived_detail(compacted_march):
+    df = cloud_cost_dashboard.load_data('2024-03-05', '2024-03-20')
+
+    assert len(df) == 16
+    assert df['cost'].sum() == pytest.approx(16.0)
+
+
+def test_month_start_range_reads_archived_detail(compacted_march):
+    df = cloud_cost_dashboard.load_data('2024-03-01', '2024-03-20')
+
+    assert len(df) == 20
+
+
+def test_broad_range_starting_mid_month_keeps_monthly_total(compacted_march):
+    df = cloud_cost_dashboard.load_data('2024-03-10', '2024-12-31')
+
+    assert list(df['timestamp']) == [datetime(2024, 3, 1)]
+    assert df['cost'].sum() == pytest.approx(31.0)
+
+
+def test_filters_apply_to_archived_detail(compacted_march):
+    assert cloud_cost_dashboard.load_data('2024-03-05', '2024-03-20', {'provider': ['Azure']}).empty
@@ -0,0 +1,148 @@
+import os
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('pdfplumber')
+pytest.importorskip('reportlab')
+
+from reportlab.lib import colors  # noqa: E402
+from reportlab.lib.pagesizes import letter  # noqa: E402
+from reportlab.lib.styles import getSampleStyleSheet  # noqa: E402
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle  # noqa: E402
+
+import invoice_ingest  # noqa: E402
+import retention  # noqa: E402
+from db import CostMonthlyRecord, CostRecord, InvoiceJob  # noqa: E402
+
+
+@pytest.fixture
+def make_invoice_pdf(tmp_path):
+    """Build an invoice PDF: optional heading lines, then one gridded line-item table.
+
+    Long tables split across pages without repeating the header row.
+    """
+    def build(rows, header=('Service', 'Amount (USD)'), heading=(), name='invoice.pdf'):
+        styles = getSampleStyleSheet()
+        story = [Paragraph(line, styles['Normal']) for line in heading]
+        table = Table([list(header)] + [list(r) for r in rows])
+        table.setStyle(TableStyle([('GRID', (0, 0), (-1, -1), 0.5, colors.black)]))
+        story.append(table)
+        path = tmp_path / name
+        SimpleDocTemplate(str(path), pagesize=letter).build(story)
+        return str(path)
+    return build
+
+
+@pytest.fixture
+def invoice_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(invoice_ingest, 'INVOICE_DIR', str(tmp_path / 'invoices'))
+    monkeypatch.setattr(invoice_ingest, 'PARSE_WORKERS', 1)
+    return tmp_path / 'invoices'
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_header_table_continuing_across_pages(make_invoice_pdf, monkeypatch, max_workers):
+    monkeypatch.setattr(invoice_ingest, 'PAGES_PER_TASK', 1)
+    rows = [(f'Service {i}', f'{i + 1}.00', f'2025-01-{i % 28 + 1:02d}') for i in range(60)]
+    path = make_invoice_pdf(rows, header=('Service', 'Amount', 'Usage Date'))
+
+    pages = invoice_ingest.extract_pdf_pages(path, max_workers=max_workers)
+    df = invoice_ingest.parse_pdf_invoice(path, max_workers=max_workers)
+
+    assert len(pages) > 1
+    assert len(df) == 60
+    assert df['cost'].sum() == pytest.approx(sum(range(1, 61)))
+    assert df.loc[df['service'] == 'Service 59', 'timestamp'].iloc[0] == datetime(2025, 1, 4)
+
+
+def test_total_and_tax_rows_are_skipped(make_invoice_pdf):
+    path = make_invoice_pdf([
+        ('Amazon EC2', '100.00'),
+        ('Amazon S3', '20.00'),
+        ('Subtotal', '120.00'),
+        ('Tax', '12.00'),
+        ('Total', '132.00'),
+    ])
+
+    df = invoice_ingest.parse_pdf_invoice(path, max_workers=1)
+
+    assert sorted(df['service']) == ['Amazon EC2', 'Amazon S3']
+
+
+def test_parenthesised_amounts_are_negative(make_invoice_pdf):
+    path = make_invoice_pdf([('Amazon EC2', '$1,234.50'), ('Credit', '($12.50)'), ('Refund', '-3.00')])
+
+    df = invoice_ingest.parse_pdf_invoice(path, max_workers=1)
+
+    assert dict(zip(df['service'], df['cost'])) == {'Amazon EC2': 1234.5, 'Credit': -12.5, 'Refund': -3.0}
+
+
+def test_provider_and_date_come_from_first_page(make_invoice_pdf):
+    path = make_invoice_pdf(
+        [('Virtual Machines', '50.00'), ('Storage', '5.00')],
+        heading=('Microsoft Azure Invoice', 'Invoice Date: 2025-03-31'),
+    )
+
+    df = invoice_ingest.parse_pdf_invoice(path, max_workers=1)
+
+    assert set(df['provider']) == {'Azure'}
+    assert set(df['timestamp']) == {datetime(2025, 3, 31)}
+
+
+def test_process_invoice_job_moves_pending_to_done(session, invoice_dir, make_invoice_pdf):
+    path = make_invoice_pdf([('Amazon EC2', '10.00'), ('Amazon S3', '2.50')], heading=('Amazon Web Services',))
+    with open(path, 'rb') as f:
+        job_id = invoice_ingest.enqueue_pdf_invoice('invoice.pdf', f.read())
+
+    job = session.get(InvoiceJob, job_id)
+    assert job.status == 'pending'
+    stored = job.path
+    assert os.path.exists(stored)
+
+    invoice_ingest.process_invoice_job(job_id)
+    session.expire_all()
+
+    job = session.get(InvoiceJob, job_id)
+    assert (job.status, job.rows, job.error) == ('done', 2, '')
+    assert job.finished_at is not None
+    assert not os.path.exists(stored)
+    records = session.query(CostRecord).all()
+    assert {(r.provider, r.service, r.cost, r.source) for r in records} == {
+        ('AWS', 'Amazon EC2', 10.0, 'invoice'),
+        ('AWS', 'Amazon S3', 2.5, 'invoice'),
+    }
+
+
+def test_invoice_lines_sharing_a_key_survive_compaction(session, invoice_dir, make_invoice_pdf, tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    monkeypatch.setattr(retention, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    # No date column: every line is stamped with the invoice date and shares one key
+    path = make_invoice_pdf(
+        [('Amazon EC2', '100.00'), ('Amazon EC2', '250.00'), ('Amazon EC2', '40.00')],
+        heading=('Amazon Web Services', 'Invoice Date: 2020-03-31'),
+    )
+    with open(path, 'rb') as f:
+        invoice_ingest.process_invoice_job(invoice_ingest.enqueue_pdf_invoice('invoice.pdf', f.read()))
+
+    retention.compact_cost_records()
+
+    monthly = session.query(CostMonthlyRecord).filter_by(service='Amazon EC2').one()
+    assert monthly.cost == pytest.approx(390.0)
+
+
+def test_enqueue_runs_job_only_in_scheduler_process(session, invoice_dir, make_invoice_pdf, monkeypatch):
+    import election
+
+    path = make_invoice_pdf([('Amazon EC2', '10.00')], heading=('Amazon Web Services',))
+    with open(path, 'rb') as f:
+        data = f.read()
+    idle = invoice_ingest.enqueue_pdf_invoice('idle.pdf', data)
+
+    monkeypatch.setattr(election, '_is_scheduler_process', True)
+    elected = invoice_ingest.enqueue_pdf_invoice('elected.pdf', data)
+    invoice_ingest._runner.submit(lambda: None).result()
+    session.expire_all()
+
+    assert session.get(InvoiceJob, idle).status == 'pending'
+    assert session.get(InvoiceJob, elected).status == 'done'
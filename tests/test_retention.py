@@ -0,0 +1,143 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from sqlalchemy import func, text
+
+import retention
+from db import CostMonthlyRecord, CostRecord, bulk_insert_cost_records, upsert_api_cost_records
+
+
+def _line(service, cost, timestamp, provider='AWS'):
+    return {
+        'provider': provider,
+        'service': service,
+        'cost': cost,
+        'timestamp': timestamp,
+        'subscription': '',
+        'resource_group': '',
+        'tags': '',
+    }
+
+
+def _total_cost(session):
+    hot = session.query(func.coalesce(func.sum(CostRecord.cost), 0.0)).scalar()
+    monthly = session.query(func.coalesce(func.sum(CostMonthlyRecord.cost), 0.0)).scalar()
+    return hot + monthly
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(retention, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    return tmp_path / 'archive'
+
+
+def test_invoice_lines_sharing_a_key_survive_compaction(session, archive_dir):
+    recent = datetime.combine(datetime.today().date(), datetime.min.time())
+    lines = [_line('Amazon EC2', cost, recent) for cost in (100.0, 250.0, 40.0)]
+    bulk_insert_cost_records(session, lines)
+
+    retention.compact_cost_records()
+
+    costs = sorted(r.cost for r in session.query(CostRecord).all())
+    assert costs == [40.0, 100.0, 250.0]
+
+
+def test_compaction_keeps_total_cost(session, archive_dir):
+    pytest.importorskip('pyarrow')
+    old = datetime(2020, 3, 15)
+    bulk_insert_cost_records(session, [_line('Amazon EC2', cost, old) for cost in (100.0, 250.0, 40.0)])
+    upsert_api_cost_records(session, [_line('Amazon S3', 7.5, old), _line('Amazon S3', 2.5, datetime(2020, 3, 16))])
+    upsert_api_cost_records(session, [_line('Amazon S3', 3.0, datetime.today())])
+    before = _total_cost(session)
+
+    stats = retention.compact_cost_records()
+    session.expire_all()
+
+    assert stats['archived'] == 5
+    assert _total_cost(session) == pytest.approx(before)
+    ec2 = session.query(CostMonthlyRecord).filter_by(service='Amazon EC2').one()
+    assert ec2.cost == pytest.approx(390.0)
+    assert len(retention.load_archived_records('2020-03-01', '2020-03-31')) == 5
+
+
+def test_api_upsert_updates_in_place_and_leaves_invoice_rows(session):
+    day = datetime(2024, 5, 1)
+    bulk_insert_cost_records(session, [_line('Amazon EC2', 100.0, day)])
+    upsert_api_cost_records(session, [_line('Amazon EC2', 10.0, day)])
+    upsert_api_cost_records(session, [_line('Amazon EC2', 12.0, day)])
+
+    rows = {(r.source, r.cost) for r in session.query(CostRecord).all()}
+    assert rows == {('invoice', 100.0), ('api', 12.0)}
+
+
+def _legacy_table(fresh_db, rows):
+    """Recreate cost_records as the pre-source schema holding (service, cost, timestamp) rows."""
+    with fresh_db.engine.begin() as conn:
+        conn.execute(text("DROP TABLE cost_records"))
+        conn.execute(text(
+            "CREATE TABLE cost_records (id INTEGER PRIMARY KEY, provider VARCHAR, service VARCHAR, cost FLOAT, "
+            "timestamp DATETIME, subscription VARCHAR, resource_group VARCHAR, tags VARCHAR)"
+        ))
+        for service, cost, timestamp in rows:
+            conn.execute(
+                text(
+                    "INSERT INTO cost_records (provider, service, cost, timestamp, subscription, resource_group, tags) "
+                    "VALUES ('AWS', :service, :cost, :timestamp, '', '', '')"
+                ),
+                # Stored the way the old ORM wrote DateTime columns
+                {'service': service, 'cost': cost, 'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')},
+            )
+        conn.execute(text("CREATE INDEX ix_cost_records_provider ON cost_records (provider)"))
+        conn.execute(text("CREATE INDEX ix_cost_unique ON cost_records (provider, service, timestamp, subscription, resource_group)"))
+
+
+def test_init_db_migrates_tables_without_source(fresh_db):
+    _legacy_table(fresh_db, [('EC2', 1.0, datetime(2024, 5, 1))])
+
+    fresh_db.init_db()
+
+    with fresh_db.engine.connect() as conn:
+        assert conn.execute(text("SELECT source FROM cost_records")).scalar() == 'api'
+        indexes = {row[1] for row in conn.execute(text("PRAGMA index_list(cost_records)"))}
+    assert 'ix_cost_api_unique' in indexes
+    # Dropped at startup rather than waiting for the first compaction run
+    assert not indexes & {'ix_cost_records_provider', 'ix_cost_unique'}
+
+
+def test_migration_dedupes_legacy_rows_so_fetches_update_them(fresh_db):
+    day = datetime(2024, 5, 1)
+    # Repeated merges stored each fetched key once per run
+    _legacy_table(fresh_db, [('EC2', 5.0, day), ('EC2', 6.0, day), ('S3', 2.0, day), ('EC2', 7.0, datetime(2024, 5, 2))])
+
+    fresh_db.init_db()
+    session = fresh_db.get_session()
+    try:
+        assert _total_cost(session) == pytest.approx(15.0)
+        upsert_api_cost_records(session, [_line('EC2', 6.5, day), _line('S3', 2.0, day)])
+        rows = sorted((r.service, r.timestamp.day, r.cost, r.source) for r in session.query(CostRecord).all())
+    finally:
+        session.close()
+    assert rows == [('EC2', 1, 6.5, 'api'), ('EC2', 2, 7.0, 'api'), ('S3', 1, 2.0, 'api')]
+
+
+def test_archive_detail_only_for_narrow_ranges_in_compacted_months():
+    compacted = pd.Period('2020-06', freq='M')
+    assert retention.wants_archive_detail('2020-03-01', '2020-04-30', compacted)
+    # Default full range and ranges reaching past compacted history stay on monthly totals
+    assert not retention.wants_archive_detail('2020-01-01', '2020-12-31', compacted)
+    assert not retention.wants_archive_detail('2020-06-01', '2020-07-15', compacted)
+    assert not retention.wants_archive_detail(None, None, compacted)
+
+
+def test_archive_reads_are_cached_until_files_change(session, archive_dir):
+    pytest.importorskip('pyarrow')
+    bulk_insert_cost_records(session, [_line('Amazon EC2', 1.0, datetime(2020, 3, 2))])
+    retention.compact_cost_records()
+
+    first = retention.load_archived_records('2020-03-01', '2020-03-31')
+    assert retention.load_archived_records('2020-03-01', '2020-03-31') is first
+
+    bulk_insert_cost_records(session, [_line('Amazon EC2', 2.0, datetime(2020, 3, 3))])
+    retention.compact_cost_records()
+    assert sorted(retention.load_archived_records('2020-03-01', '2020-03-31')['cost']) == [1.0, 2.0]
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import shared_cache
+from db import bulk_insert_cost_records
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(shared_cache, '_memo', {})
+    return tmp_path / 'cache'
+
+
+def _frame():
+    return pd.DataFrame({
+        'provider': ['AWS', 'Azure', 'AWS'],
+        'service': ['EC2', 'VM', 'S3'],
+        'cost': [1.0, 2.0, 3.0],
+        'timestamp': pd.to_datetime(['2025-01-01', '2025-01-02', '2025-02-01']),
+    })
+
+
+def test_read_frame_filters_before_copying(session, cache_dir):
+    pa = pytest.importorskip('pyarrow')
+
+    df = shared_cache.read_frame('costs', _frame, '2025-01-01', '2025-01-31', {'provider': ['AWS'], 'service': []})
+
+    assert list(df['service']) == ['EC2']
+    # The worker keeps the memory-mapped table, not a pandas copy of every row
+    assert isinstance(shared_cache._memo['costs'][1], pa.Table)
+
+
+def test_snapshot_is_built_once_per_version(session, cache_dir, monkeypatch):
+    pytest.importorskip('pyarrow')
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return _frame()
+
+    shared_cache.read_frame('costs', loader)
+    # Another worker: empty memo, same version -> maps the existing snapshot
+    monkeypatch.setattr(shared_cache, '_memo', {})
+    assert len(shared_cache.read_frame('costs', loader)) == 3
+    assert len(calls) == 1
+
+    bulk_insert_cost_records(session, [{
+        'provider': 'AWS', 'service': 'EC2', 'cost': 1.0, 'timestamp': datetime(2025, 1, 1),
+        'subscription': '', 'resource_group': '', 'tags': '',
+    }])
+    shared_cache.read_frame('costs', loader)
+    assert len(calls) == 2
+    assert [p.name for p in cache_dir.iterdir()] == ['costs-v1.arrow']
+
+
+def test_filters_on_empty_snapshot(session, cache_dir):
+    pytest.importorskip('pyarrow')
+    empty = lambda: pd.DataFrame(columns=['provider', 'timestamp'])  # noqa: E731
+
+    assert shared_cache.read_frame('empty', empty, filters={'provider': ['AWS']}).empty